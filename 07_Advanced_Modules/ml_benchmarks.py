@@ -0,0 +1,1128 @@
+#!/usr/bin/env python3
+"""
+SIEM Platform ML Anomaly Detection Benchmarks
+
+Micro-benchmarks for the performance-sensitive paths of the ML anomaly
+detection module, plus end-to-end synthetic SIEM workloads (workload_*) that
+report throughput, latency percentiles, peak RSS and detection precision /
+recall. Each benchmark returns a JSON-serialisable dict so results can be
+diffed between releases. The 1M and 10M workloads only run when named.
+
+Usage:
+    python ml_benchmarks.py                 # run every benchmark
+    python ml_benchmarks.py log_features    # run a single benchmark
+    python ml_benchmarks.py workload_10k --output release.json  # end-to-end synthetic workload
+
+Benchmarks that enforce a budget report "passed"; the script exits non-zero
+if any of them fails, so it can gate CI.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BENCHMARKS: Dict[str, Callable[..., Dict[str, Any]]] = {}
+
+def benchmark(name: str):
+    """Register a benchmark function under the given name"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+def synthetic_log_corpus(n_lines: int, seed: int = 42) -> List[str]:
+    """Generate templated SIEM-style log lines with variable IPs, users and PIDs"""
+    rng = random.Random(seed)
+    templates = [
+        "Accepted password for {user} from {ip} port {port} ssh2",
+        "Failed password for invalid user {user} from {ip} port {port} ssh2",
+        "session opened for user {user} by (uid=0)",
+        "sshd[{pid}]: Connection closed by {ip} port {port} [preauth]",
+        "kernel: [UFW BLOCK] IN=eth0 OUT= SRC={ip} DST=10.0.0.5 PROTO=TCP SPT={port} DPT=443",
+        "sudo: {user} : TTY=pts/0 ; PWD=/home/{user} ; USER=root ; COMMAND=/usr/bin/systemctl restart nginx",
+        "CRON[{pid}]: (root) CMD (/usr/local/bin/backup.sh --target /var/backups/{user} --compress --verbose)",
+        "Database query executed",
+    ]
+    lines = []
+    for _ in range(n_lines):
+        template = rng.choice(templates)
+        lines.append(template.format(
+            user=f"user{rng.randint(1, 500)}",
+            ip=f"192.168.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+            port=rng.randint(1024, 65535),
+            pid=rng.randint(100, 99999)
+        ))
+    return lines
+
+def synthetic_user_events(n_events: int, n_users: int, seed: int = 42,
+                          start: str = '2024-01-01') -> pd.DataFrame:
+    """Generate security events with Zipf-skewed user activity"""
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, n_users + 1)
+    weights = 1.0 / ranks
+    users = rng.choice(n_users, size=n_events, p=weights / weights.sum())
+    event_types = np.array(['login', 'file_access', 'network', 'failed_login',
+                            'privilege_escalation', 'data_transfer'])
+    offsets = np.sort(rng.integers(0, 30 * 86400, size=n_events))
+    return pd.DataFrame({
+        'user_id': np.char.add('user', users.astype(str)),
+        'timestamp': pd.Timestamp(start) + pd.to_timedelta(offsets, unit='s'),
+        'event_type': event_types[rng.choice(len(event_types), size=n_events,
+                                             p=[0.4, 0.3, 0.2, 0.05, 0.01, 0.04])],
+        'source_ip': np.char.add('192.168.1.', (users % 254 + rng.integers(0, 2, n_events)).astype(str)),
+        'destination_ip': np.char.add('10.0.0.', rng.integers(1, 50, n_events).astype(str)),
+        'bytes_transferred': rng.integers(1000, 10000, n_events)
+    })
+
+WORKLOAD_EVENT_TYPES = ('login', 'file_access', 'network', 'failed_login', 'privilege_escalation', 'data_transfer')
+WORKLOAD_EVENT_WEIGHTS = (0.4, 0.3, 0.2, 0.05, 0.01, 0.04)
+WORKLOAD_METRICS = ('cpu', 'memory', 'requests')
+WORKLOAD_LOG_TEMPLATES = {
+    'login': ("Accepted password for {user} from {ip} port {port} ssh2",
+              "session opened for user {user} by (uid=0)"),
+    'file_access': ("sudo: {user} : TTY=pts/0 ; PWD=/home/{user} ; USER=root ; COMMAND=/usr/bin/cat /var/log/syslog",),
+    'network': ("sshd[{pid}]: Connection closed by {ip} port {port} [preauth]",
+                "kernel: [UFW BLOCK] IN=eth0 OUT= SRC={ip} DST=10.0.0.5 PROTO=TCP SPT={port} DPT=443"),
+    'failed_login': ("Failed password for invalid user {user} from {ip} port {port} ssh2",),
+    'privilege_escalation': ("sudo: {user} : TTY=pts/0 ; PWD=/home/{user} ; USER=root ; COMMAND=/usr/bin/systemctl restart nginx",),
+    'data_transfer': ("CRON[{pid}]: (root) CMD (/usr/local/bin/backup.sh --target /var/backups/{user} --compress)",),
+}
+ANOMALY_KINDS = ('behavioral', 'metric', 'log')
+
+def iter_synthetic_workload(n_events: int, n_users: Optional[int] = None, n_hosts: Optional[int] = None,
+                            anomaly_rate: float = 0.0, clean_events: int = 0, days: float = 14.0,
+                            chunk_size: int = 100000, seed: int = 42,
+                            start: str = '2024-01-01') -> Iterator[pd.DataFrame]:
+    """
+    Yield a reproducible SIEM event stream in chunks of at most chunk_size rows
+
+    Users are Zipf-distributed; every event carries a templated log line for
+    its event type and a seasonal (daily + weekly) reading of one metric of
+    the user's host. Timestamps are unique and evenly spaced over ``days``.
+    After the first ``clean_events`` rows a fraction ``anomaly_rate`` of rows
+    gets one injected anomaly: a behavioral outlier (large transfer from an
+    unseen IP), a metric spike, or a log line from a template never seen
+    before; ``injected`` / ``anomaly_kind`` hold the ground truth. Chunk k
+    only depends on (seed, k), so any size streams in bounded memory.
+    """
+    n_users = n_users or max(100, n_events // 1000)
+    n_hosts = n_hosts or max(10, n_users // 20)
+    weights = 1.0 / np.arange(1, n_users + 1)
+    weights /= weights.sum()
+    host_base = np.random.default_rng(seed).uniform(20, 80, size=(n_hosts, len(WORKLOAD_METRICS)))
+    spacing_ns = int(days * 86400e9 / max(n_events, 1))
+    origin = pd.Timestamp(start).value
+    event_types = np.array(WORKLOAD_EVENT_TYPES, dtype=object)
+    metric_names = np.array(WORKLOAD_METRICS, dtype=object)
+    kind_names = np.array(ANOMALY_KINDS, dtype=object)
+
+    for chunk_start in range(0, n_events, chunk_size):
+        rng = np.random.default_rng([seed, chunk_start // chunk_size])
+        index = np.arange(chunk_start, min(chunk_start + chunk_size, n_events))
+        n = len(index)
+        users = rng.choice(n_users, size=n, p=weights)
+        hosts = users % n_hosts
+        metrics = index % len(WORKLOAD_METRICS)
+        types = event_types[rng.choice(len(event_types), size=n, p=WORKLOAD_EVENT_WEIGHTS)]
+        source_ips = np.char.add('192.168.', np.char.add((users // 254 % 256).astype(str),
+                                                          np.char.add('.', (users % 254 + 1).astype(str)))).astype(object)
+        transferred = rng.lognormal(8, 0.5, n).astype(np.int64)
+
+        # Seasonal metric per (host, metric): daily and weekly cycles plus noise
+        elapsed_days = index * spacing_ns / 86400e9
+        base = host_base[hosts, metrics]
+        values = base * (1 + 0.3 * np.sin(2 * np.pi * elapsed_days) + 0.1 * np.sin(2 * np.pi * elapsed_days / 7)
+                         + 0.02 * rng.standard_normal(n))
+
+        kinds = np.full(n, '', dtype=object)
+        if anomaly_rate:
+            injected = (rng.random(n) < anomaly_rate) & (index >= clean_events)
+            kinds[injected] = kind_names[rng.integers(0, len(ANOMALY_KINDS), int(injected.sum()))]
+        behavioral, spike, novel = kinds == 'behavioral', kinds == 'metric', kinds == 'log'
+        types[behavioral] = 'data_transfer'
+        source_ips[behavioral] = '203.0.113.' + (index[behavioral] % 254 + 1).astype(str).astype(object)
+        transferred[behavioral] *= 100
+        values[spike] += 2 * base[spike]
+
+        ports, pids, variants = rng.integers(1024, 65535, n), rng.integers(100, 99999, n), rng.integers(0, 2, n)
+        messages = [WORKLOAD_LOG_TEMPLATES[event_type][variant % len(WORKLOAD_LOG_TEMPLATES[event_type])].format(
+                        user=f"user{user}", ip=ip, port=port, pid=pid)
+                    for event_type, variant, user, ip, port, pid
+                    in zip(types, variants.tolist(), users.tolist(), source_ips, ports.tolist(), pids.tolist())]
+        for row in np.flatnonzero(novel):
+            messages[row] = (f"kernel: traps: worker[{pids[row]}] general protection fault ip:{ports[row]:x} "
+                             f"sp:7ffd{pids[row]:x} error:0 in libcrypto.so.3")
+
+        yield pd.DataFrame({
+            'event_id': index,
+            'timestamp': pd.to_datetime(origin + index * spacing_ns),
+            'user_id': np.char.add('user', users.astype(str)).astype(object),
+            'event_type': types,
+            'source_ip': source_ips,
+            'destination_ip': np.char.add('10.0.0.', rng.integers(1, 50, n).astype(str)).astype(object),
+            'bytes_transferred': transferred,
+            'host': np.char.add('host', hosts.astype(str)).astype(object),
+            'metric_name': metric_names[metrics],
+            'metric_value': values,
+            'log_message': messages,
+            'injected': kinds != '',
+            'anomaly_kind': kinds
+        })
+
+class InMemoryBroker:
+    """
+    In-process stand-in for a Kafka cluster: one partition per topic,
+    kafka-python-shaped consumer/producer objects and committed offsets
+    """
+
+    class Record:
+        def __init__(self, topic: str, offset: int, value: Any):
+            self.topic = topic
+            self.partition = 0
+            self.offset = offset
+            self.value = value
+
+    class Consumer:
+        def __init__(self, broker: 'InMemoryBroker', topic: str):
+            self.broker = broker
+            self.topic = topic
+            self.position = broker.committed.get(topic, 0)
+
+        def poll(self, timeout_ms: int = 0, max_records: int = 500) -> Dict[Any, List[Any]]:
+            log = self.broker.topics[self.topic]
+            if self.position >= len(log):
+                time.sleep(timeout_ms / 1000)
+                return {}
+            records = log[self.position:self.position + max(max_records, 1)]
+            self.position += len(records)
+            return {(self.topic, 0): records}
+
+        def commit(self, offsets: Dict[Any, Any]):
+            for (topic, _partition), offset in offsets.items():
+                self.broker.committed[topic] = offset.offset
+
+        def close(self):
+            pass
+
+    class Producer:
+        def __init__(self, broker: 'InMemoryBroker'):
+            self.broker = broker
+
+        def send(self, topic: str, value: Any):
+            self.broker.publish(topic, value)
+
+        def flush(self):
+            pass
+
+        def close(self):
+            pass
+
+    def __init__(self):
+        self.topics: Dict[str, List['InMemoryBroker.Record']] = {}
+        self.committed: Dict[str, int] = {}
+
+    def publish(self, topic: str, value: Any):
+        log = self.topics.setdefault(topic, [])
+        log.append(self.Record(topic, len(log), value))
+
+    def consumer(self, topic: str) -> 'InMemoryBroker.Consumer':
+        self.topics.setdefault(topic, [])
+        return self.Consumer(self, topic)
+
+    def producer(self) -> 'InMemoryBroker.Producer':
+        return self.Producer(self)
+
+def _rss_mb() -> float:
+    """Current resident set size in MB (Linux /proc, falls back to peak RSS)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _timed(func: Callable, *args, **kwargs) -> float:
+    """Wall-clock seconds for a single call"""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+@benchmark("log_features")
+def bench_log_features(n_lines: int = 2000, batch_sizes: tuple = (1, 8, 32, 64),
+                       num_threads: int = None, model_name: str = "distilbert-base-uncased") -> Dict[str, Any]:
+    """Lines/sec of LogAnomalyDetector.extract_features per batch size (1 = per-line path)"""
+    from ml_anomaly_detection import LogAnomalyDetector
+
+    logs = synthetic_log_corpus(n_lines)
+    detector = LogAnomalyDetector(model_name, num_threads=num_threads)
+    detector.extract_features(logs[:16], learn=True)  # warm up
+
+    results = {'n_lines': n_lines, 'lines_per_sec': {}}
+    for batch_size in batch_sizes:
+        detector.batch_size = batch_size
+        elapsed = _timed(detector.extract_features, logs, learn=True)
+        results['lines_per_sec'][str(batch_size)] = round(n_lines / elapsed, 1)
+        logger.info(f"log_features batch_size={batch_size}: {n_lines / elapsed:.1f} lines/sec")
+
+    baseline = results['lines_per_sec'].get('1')
+    if baseline:
+        results['speedup_vs_per_line'] = {
+            size: round(rate / baseline, 2) for size, rate in results['lines_per_sec'].items()
+        }
+    return results
+
+@benchmark("log_template_cache")
+def bench_log_template_cache(n_lines: int = 20000, cache_size: int = 10000,
+                             model_name: str = "distilbert-base-uncased") -> Dict[str, Any]:
+    """Lines/sec with and without template mining + embedding cache on a templated corpus"""
+    from ml_anomaly_detection import LogAnomalyDetector
+
+    logs = synthetic_log_corpus(n_lines)
+    results = {'n_lines': n_lines}
+    for label, use_templates in (('raw', False), ('templated', True)):
+        detector = LogAnomalyDetector(model_name, use_templates=use_templates, cache_size=cache_size)
+        elapsed = _timed(detector.extract_features, logs, learn=True)
+        results[label] = {'lines_per_sec': round(n_lines / elapsed, 1), 'cache': detector.cache_stats()}
+        logger.info(f"log_template_cache {label}: {n_lines / elapsed:.1f} lines/sec")
+    return results
+
+@benchmark("log_encoder_backends")
+def bench_log_encoder_backends(n_train: int = 2000, n_test: int = 1000,
+                               backends: tuple = ('torch', 'torch-int8', 'onnx'),
+                               model_name: str = "distilbert-base-uncased",
+                               min_agreement: float = 0.95) -> Dict[str, Any]:
+    """Startup, RSS, lines/sec and anomaly-decision parity of each encoder backend vs fp32 torch"""
+    from ml_anomaly_detection import LogAnomalyDetector
+
+    normal_logs = synthetic_log_corpus(n_train, seed=1)
+    test_logs = synthetic_log_corpus(n_test, seed=2)
+    results = {'n_train': n_train, 'n_test': n_test, 'backends': {}}
+    reference = None
+
+    for backend in backends:
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        try:
+            detector = LogAnomalyDetector(model_name, use_templates=False, encoder_backend=backend)
+        except ImportError as e:
+            logger.warning(f"Skipping {backend} backend: {e}")
+            continue
+        startup = time.perf_counter() - start
+        rss_delta = _rss_mb() - rss_before
+
+        detector.train(normal_logs)
+        start = time.perf_counter()
+        decisions = detector.score_batch(test_logs, [None] * n_test).is_anomaly
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = decisions
+        agreement = float(np.mean(decisions == reference))
+        results['backends'][backend] = {
+            'startup_sec': round(startup, 3),
+            'rss_delta_mb': round(rss_delta, 1),
+            'lines_per_sec': round(n_test / elapsed, 1),
+            'decision_agreement': round(agreement, 4),
+            'parity_ok': agreement >= min_agreement
+        }
+        logger.info(f"log_encoder_backends {backend}: {results['backends'][backend]}")
+        del detector
+
+    results['passed'] = all(result['parity_ok'] for result in results['backends'].values())
+    return results
+
+@benchmark("behavioral_features")
+def bench_behavioral_features(sizes: tuple = ((1000, 100000), (10000, 1000000))) -> Dict[str, Any]:
+    """Feature extraction + per-user row grouping time for (users, events) sizes; should scale ~linearly"""
+    from ml_anomaly_detection import BehavioralAnomalyDetector
+
+    detector = BehavioralAnomalyDetector()
+    results = {}
+    for n_users, n_events in sizes:
+        events = synthetic_user_events(n_events, n_users)
+        start = time.perf_counter()
+        features = detector.extract_behavioral_features(events).to_numpy(dtype=float)
+        groups = sum(1 for _user, rows in detector.group_rows_by_user(events['user_id']) if len(rows))
+        elapsed = time.perf_counter() - start
+        results[f"{n_users}x{n_events}"] = {
+            'seconds': round(elapsed, 3),
+            'events_per_sec': round(n_events / elapsed, 1),
+            'users': groups,
+            'features': features.shape[1]
+        }
+        logger.info(f"behavioral_features {n_users} users x {n_events} events: {elapsed:.3f}s")
+    return results
+
+@benchmark("behavioral_interning")
+def bench_behavioral_interning(n_events: int = 1000000, n_users: int = 10000) -> Dict[str, Any]:
+    """Frame memory and feature extraction time, raw object columns vs interned (10M events needs ~3GB free)"""
+    from ml_anomaly_detection import BehavioralAnomalyDetector
+
+    columns = ['timestamp', 'user_id', 'event_type', 'source_ip', 'destination_ip', 'bytes_transferred']
+    events = pd.concat([chunk[columns] for chunk in iter_synthetic_workload(n_events, n_users=n_users)],
+                       ignore_index=True)
+    events = events.astype({column: object for column in columns[1:5]})  # as built from dicts / JSON
+    detector = BehavioralAnomalyDetector()
+    results = {'n_events': n_events, 'n_users': n_users}
+
+    results['raw_memory_mb'] = round(events.memory_usage(deep=True).sum() / 2**20, 1)
+    results['raw_features_seconds'] = round(_timed(detector.extract_behavioral_features, events), 3)
+    start = time.perf_counter()
+    interned = detector.intern_events(events)
+    results['intern_seconds'] = round(time.perf_counter() - start, 3)
+    del events
+    results['interned_memory_mb'] = round(interned.memory_usage(deep=True).sum() / 2**20, 1)
+    results['interned_features_seconds'] = round(_timed(detector.extract_behavioral_features, interned), 3)
+    logger.info(f"behavioral_interning: {results}")
+    return results
+
+@benchmark("behavioral_window")
+def bench_behavioral_window(n_events: int = 1000000, n_users: int = 10000, batch_size: int = 1000,
+                            window_hours: int = 24) -> Dict[str, Any]:
+    """Sliding-window feature state: per-batch update + read vs per-batch recompute, state size and save cost"""
+    import tempfile
+    from ml_anomaly_detection import BehavioralAnomalyDetector, BehavioralWindowStore
+
+    columns = ['timestamp', 'user_id', 'event_type', 'source_ip', 'destination_ip', 'bytes_transferred']
+    events = pd.concat([chunk[columns] for chunk in iter_synthetic_workload(n_events, n_users=n_users)],
+                       ignore_index=True)
+    batches = [events.iloc[start:start + batch_size] for start in range(0, n_events, batch_size)]
+    store = BehavioralWindowStore(window_hours=window_hours)
+    detector = BehavioralAnomalyDetector()
+
+    samples = {'window': [], 'recompute': []}
+    for batch in batches:
+        samples['window'].append(_timed(store.observe, batch) * 1000)
+        samples['recompute'].append(_timed(detector.extract_behavioral_features, batch) * 1000)
+    results = {'n_events': n_events, 'n_users': n_users, 'batch_size': batch_size, 'window_hours': window_hours,
+               'batch_ms': {name: {'p50': round(float(np.median(values)), 3),
+                                   'p99': round(float(np.percentile(values, 99)), 3)}
+                            for name, values in samples.items()},
+               'state_bytes_per_user': round((store.bucket_hours.nbytes + store.sums.nbytes
+                                              + store.registers.nbytes) / len(store.bucket_hours), 1)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        blocks = store.save(directory)
+        results['full_save'] = {'blocks': blocks, 'seconds': round(time.perf_counter() - start, 3)}
+        store.observe(batches[-1])
+        start = time.perf_counter()
+        blocks = store.save(directory)
+        results['incremental_save'] = {'blocks': blocks, 'seconds': round(time.perf_counter() - start, 3)}
+        results['load_seconds'] = round(_timed(BehavioralWindowStore.load, directory), 3)
+    logger.info(f"behavioral_window: {results}")
+    return results
+
+@benchmark("behavioral_parallel")
+def bench_behavioral_parallel(n_users: int = 500, n_events: int = 200000,
+                              worker_counts: tuple = (1, 4, -1)) -> Dict[str, Any]:
+    """BehavioralAnomalyDetector train/score wall time per worker count, with a determinism check"""
+    from ml_anomaly_detection import BehavioralAnomalyDetector
+
+    events = synthetic_user_events(n_events, n_users)
+    results = {'n_users': n_users, 'n_events': n_events, 'workers': {}}
+    reference = None
+    for n_jobs in worker_counts:
+        detector = BehavioralAnomalyDetector(n_jobs=n_jobs)
+        train_seconds = _timed(detector.train, events)
+        start = time.perf_counter()
+        scores = detector.score_batch(events).anomaly_scores
+        score_seconds = time.perf_counter() - start
+        if reference is None:
+            reference = scores
+        results['workers'][str(n_jobs)] = {
+            'train_seconds': round(train_seconds, 3),
+            'score_seconds': round(score_seconds, 3),
+            'identical_scores': bool(np.array_equal(scores, reference))
+        }
+        logger.info(f"behavioral_parallel n_jobs={n_jobs}: {results['workers'][str(n_jobs)]}")
+    return results
+
+@benchmark("redis_store")
+def bench_redis_store(n_anomalies: int = 50000, chunk_sizes: tuple = (100, 1000, 5000)) -> Dict[str, Any]:
+    """Anomalies/sec written by store_results vs one setex round-trip per anomaly (fakeredis stand-in)"""
+    import asyncio
+    from datetime import datetime, timedelta
+    import fakeredis
+    from ml_anomaly_detection import AnomalyDetectionEngine, AnomalyResult
+
+    base = datetime(2024, 1, 1)
+    anomalies = [
+        AnomalyResult(timestamp=base + timedelta(seconds=i), source="behavioral_analysis",
+                      anomaly_score=float(i % 97) / 97, is_anomaly=True, confidence=0.9,
+                      features={"user_id": f"user{i % 500}"}, explanation="benchmark", severity="medium")
+        for i in range(n_anomalies)
+    ]
+    engine = AnomalyDetectionEngine({'enable_time_series': False, 'enable_log_analysis': False,
+                                     'enable_behavioral': False})
+    results = {'n_anomalies': n_anomalies}
+
+    engine.redis_client = fakeredis.FakeRedis()
+    start = time.perf_counter()
+    for result in anomalies:
+        engine.redis_client.setex(f"anomaly:{result.timestamp.isoformat()}:{result.source}", 86400,
+                                  json.dumps({'anomaly_score': result.anomaly_score}))
+    results['per_key_setex'] = round(n_anomalies / (time.perf_counter() - start), 1)
+
+    for chunk_size in chunk_sizes:
+        for indexed in (False, True):
+            engine.redis_client = fakeredis.FakeRedis()
+            engine.redis_chunk_size = chunk_size
+            engine.index_anomalies = indexed
+            elapsed = _timed(asyncio.run, engine.store_results(anomalies))
+            label = f"pipelined_{chunk_size}" + ("_indexed" if indexed else "")
+            results[label] = round(n_anomalies / elapsed, 1)
+            logger.info(f"redis_store {label}: {n_anomalies / elapsed:.1f} anomalies/sec")
+
+    engine.close()
+    return results
+
+@benchmark("kafka_streaming")
+def bench_kafka_streaming(n_events: int = 200000, n_users: int = 1000,
+                          batch_sizes: tuple = (500, 5000)) -> Dict[str, Any]:
+    """Sustained events/sec and p99 batch latency of StreamingAnomalyRunner on an in-process broker"""
+    import asyncio
+    import fakeredis
+    from ml_anomaly_detection import AnomalyDetectionEngine, StreamingAnomalyRunner
+
+    events = synthetic_user_events(n_events, n_users)
+    engine = AnomalyDetectionEngine({'enable_time_series': False, 'enable_log_analysis': False,
+                                     'behavioral_mode': 'population'})
+    engine.redis_client = fakeredis.FakeRedis()
+    engine.train_all_detectors({'user_events': events})
+
+    payloads = events.assign(timestamp=events['timestamp'].astype(str)).to_dict('records')
+    results = {'n_events': n_events}
+    for batch_size in batch_sizes:
+        broker = InMemoryBroker()
+        for payload in payloads:
+            broker.publish('siem-events', payload)
+        runner = StreamingAnomalyRunner(engine, broker.consumer('siem-events'), broker.producer(),
+                                        'siem-anomalies', max_batch_size=batch_size,
+                                        max_batch_latency=0.5, poll_timeout_ms=10)
+        asyncio.run(runner.run(max_batches=-(-n_events // batch_size)))
+        stats = runner.stats()
+        stats['committed_offset'] = broker.committed.get('siem-events', 0)
+        results[f"batch_{batch_size}"] = stats
+        logger.info(f"kafka_streaming batch_size={batch_size}: {stats}")
+        runner.close()
+
+    engine.close()
+    return results
+
+@benchmark("columnar_results")
+def bench_columnar_results(n_events: int = 1000000, n_users: int = 2000) -> Dict[str, Any]:
+    """Wall time and peak Python allocations: per-row AnomalyResult lists vs columnar anomalies-only"""
+    import tracemalloc
+    from ml_anomaly_detection import BehavioralAnomalyDetector
+
+    events = synthetic_user_events(n_events, n_users)
+    detector = BehavioralAnomalyDetector(mode='population')
+    detector.train(events)
+
+    results = {'n_events': n_events}
+    for label, run in (
+        ('all_rows_as_objects', lambda: detector.detect_anomalies(events)),
+        ('columnar_anomalies_only', lambda: detector.score_batch(events).anomalies().to_results()),
+    ):
+        tracemalloc.start()
+        start = time.perf_counter()
+        output = run()
+        elapsed = time.perf_counter() - start
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[label] = {'seconds': round(elapsed, 3), 'peak_mb': round(peak / 2**20, 1), 'objects': len(output)}
+        logger.info(f"columnar_results {label}: {results[label]}")
+        del output
+    return results
+
+@benchmark("scoring_tail")
+def bench_scoring_tail(n_events: int = 1000000, n_users: int = 2000) -> Dict[str, Any]:
+    """Per-row cost of behavioral scoring outside feature extraction and inference, and of materializing anomalies"""
+    from ml_anomaly_detection import BehavioralAnomalyDetector, PipelineProfiler
+
+    events = synthetic_user_events(n_events, n_users)
+    detector = BehavioralAnomalyDetector(mode='population')
+    detector.train(events.iloc[:max(n_events // 5, 1000)])
+    detector.profiler = PipelineProfiler(enabled=True)
+
+    start = time.perf_counter()
+    batch = detector.score_batch(events)
+    scored = time.perf_counter() - start
+    staged = sum(stage['total_seconds'] for stage in detector.profiler.stats()['stages'].values())
+    anomalies = batch.anomalies()
+    materialize = _timed(anomalies.to_results)
+
+    results = {
+        'n_events': n_events,
+        'score_batch_seconds': round(scored, 3),
+        'tail_us_per_row': round((scored - staged) / n_events * 1e6, 3),
+        'anomalies': len(anomalies),
+        'materialize_us_per_anomaly': round(materialize / max(len(anomalies), 1) * 1e6, 3)
+    }
+    logger.info(f"scoring_tail: {results}")
+    return results
+
+@benchmark("model_cold_start")
+def bench_model_cold_start(n_users: int = 2000, n_events: int = 100000) -> Dict[str, Any]:
+    """Worker cold start: legacy single-pickle load vs versioned store with lazy per-user shards"""
+    import tempfile
+    import joblib
+    from ml_anomaly_detection import BehavioralAnomalyDetector, ModelArtifactStore
+
+    events = synthetic_user_events(n_events, n_users)
+    detector = BehavioralAnomalyDetector()
+    detector.train(events)
+    one_user = events[events['user_id'] == next(iter(detector.models))]
+
+    results = {'n_users': len(detector.models)}
+    with tempfile.TemporaryDirectory() as root:
+        legacy_path = os.path.join(root, "behavioral_models.pkl")
+        joblib.dump(detector.models, legacy_path)
+        store = ModelArtifactStore(os.path.join(root, "store"))
+        results['save_seconds'] = round(_timed(store.save, {'behavioral': detector}), 3)
+
+        results['legacy_load_seconds'] = round(_timed(joblib.load, legacy_path), 3)
+        cold = BehavioralAnomalyDetector()
+        results['store_load_seconds'] = round(_timed(store.load, {'behavioral': cold}), 3)
+        results['first_user_score_seconds'] = round(_timed(cold.score_batch, one_user), 3)
+        results['shards_loaded'] = len(cold.models.shards.loaded)
+    logger.info(f"model_cold_start: {results}")
+    return results
+
+@benchmark("time_series_inference")
+def bench_time_series_inference(batch_sizes: tuple = (1, 32, 1024), sequence_length: int = 60,
+                                n_points: int = 3000, repeats: int = 20) -> Dict[str, Any]:
+    """Per-call LSTM latency: Keras predict vs predict_on_batch vs the compiled predict() path"""
+    from ml_anomaly_detection import TimeSeriesAnomalyDetector
+
+    t = np.arange(n_points)
+    metrics = pd.DataFrame({'cpu': np.sin(2 * np.pi * t / 1440), 'rps': np.cos(2 * np.pi * t / 60)},
+                           index=pd.date_range('2024-01-01', periods=n_points, freq='min'))
+    detector = TimeSeriesAnomalyDetector(sequence_length=sequence_length)
+    detector.train(metrics, epochs=1)
+    windows, _ = detector.prepare_sequences(detector.scaler.transform(metrics.values))
+
+    results = {'sequence_length': sequence_length, 'batch_sizes': {}}
+    for batch_size in batch_sizes:
+        batch = np.ascontiguousarray(np.resize(windows, (batch_size,) + windows.shape[1:]))
+        paths = {
+            'keras_predict': lambda: detector.model.predict(batch, verbose=0),
+            'predict_on_batch': lambda: detector.model.predict_on_batch(batch),
+            'compiled': lambda: detector.predict(batch),
+        }
+        timings = {}
+        for label, run in paths.items():
+            run()  # warm-up: tracing / XLA compilation is a one-off cost
+            samples = [_timed(run) * 1000 for _ in range(repeats)]
+            timings[label] = {'p50_ms': round(float(np.median(samples)), 3),
+                              'p99_ms': round(float(np.percentile(samples, 99)), 3)}
+        results['batch_sizes'][str(batch_size)] = timings
+        logger.info(f"time_series_inference batch_size={batch_size}: {timings}")
+    return results
+
+@benchmark("time_series_bank")
+def bench_time_series_bank(series_counts: tuple = (100, 1000, 10000), points_per_batch: int = 20000,
+                           sequence_length: int = 30) -> Dict[str, Any]:
+    """Detector bank scoring time for a fixed batch size spread over more and more series"""
+    from ml_anomaly_detection import TimeSeriesDetectorBank
+
+    def metric_events(n_series: int, n_steps: int, t0: int = 0) -> pd.DataFrame:
+        steps = np.arange(t0, t0 + n_steps)
+        series = np.arange(n_series)
+        grid_series, grid_steps = np.meshgrid(series, steps)
+        values = 1 + 0.5 * np.sin(2 * np.pi * (grid_steps + grid_series) / 60)
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(grid_steps.ravel() * 60, unit='s'),
+            'host': (grid_series.ravel() // 4).astype(str),
+            'metric_name': (grid_series.ravel() % 4).astype(str),
+            'metric_value': values.ravel() * (1 + grid_series.ravel() % 7)
+        })
+
+    bank = TimeSeriesDetectorBank(sequence_length=sequence_length)
+    bank.train(metric_events(50, 400), epochs=1)
+    results = {'points_per_batch': points_per_batch, 'series': {}}
+    for n_series in series_counts:
+        bank.reset_stream()
+        n_steps = max(1, points_per_batch // n_series)
+        bank.score_batch(metric_events(n_series, sequence_length))  # warm every window
+        batch = metric_events(n_series, n_steps, t0=sequence_length)
+        start = time.perf_counter()
+        scored = bank.score_batch(batch)
+        elapsed = time.perf_counter() - start
+        results['series'][str(n_series)] = {
+            'points': len(batch),
+            'scored': len(scored),
+            'seconds': round(elapsed, 3),
+            'points_per_second': round(len(batch) / elapsed)
+        }
+        logger.info(f"time_series_bank n_series={n_series}: {results['series'][str(n_series)]}")
+    return results
+
+@benchmark("prefilter_recall")
+def bench_prefilter_recall(n_events: int = 200000, n_users: int = 1000, batch_size: int = 10000,
+                           anomaly_rate: float = 0.005) -> Dict[str, Any]:
+    """Statistical prefilter: fraction pruned per tier and the recall it costs the behavioral detector"""
+    from ml_anomaly_detection import BehavioralAnomalyDetector, StatisticalPrefilter
+
+    rng = np.random.default_rng(7)
+    events = synthetic_user_events(n_events, n_users)
+    events['host'] = 'host' + (events['user_id'].str[4:].astype(int) % 20).astype(str)
+    events['metric_name'] = 'cpu'
+    minutes = (events['timestamp'] - events['timestamp'].min()).dt.total_seconds() / 60
+    events['metric_value'] = 50 + 20 * np.sin(2 * np.pi * minutes / 1440) + rng.normal(0, 2, n_events)
+    events['log_message'] = synthetic_log_corpus(n_events)
+
+    # Inject anomalies into the second half only: new IPs, privilege escalation,
+    # CPU spikes and a log template never seen before
+    split = n_events // 2
+    injected = np.zeros(n_events, dtype=bool)
+    injected[split + rng.choice(n_events - split, int((n_events - split) * anomaly_rate), replace=False)] = True
+    events.loc[injected, 'source_ip'] = '203.0.113.' + pd.Series(rng.integers(1, 254, injected.sum())).astype(str).values
+    events.loc[injected, 'event_type'] = 'privilege_escalation'
+    events.loc[injected, 'metric_value'] += 60
+    events.loc[injected, 'log_message'] = 'kernel: general protection fault in module ' + events.loc[injected, 'user_id']
+    events['injected'] = injected
+
+    # Scoring advances the window state, so the cascade gets its own identically trained detector
+    detector, cascade = BehavioralAnomalyDetector(mode='population'), BehavioralAnomalyDetector(mode='population')
+    detector.train(events.iloc[:split])
+    cascade.train(events.iloc[:split])
+    prefilter = StatisticalPrefilter()
+    for start in range(0, split, batch_size):
+        prefilter.candidates(events.iloc[start:start + batch_size])
+    prefilter.stats = {tier: {'rows': 0, 'candidates': 0} for tier in prefilter.TIERS}
+
+    def flagged(batch) -> set:
+        anomalies = batch.anomalies()
+        return {(timestamp, features['user_id']) for timestamp, features
+                in zip(anomalies.timestamps, anomalies._features(anomalies.index))}
+
+    kept = {tier: 0 for tier in prefilter.TIERS}
+    full_flags, cascade_flags, truth = set(), set(), set()
+    full_seconds = prefilter_seconds = cascade_seconds = 0.0
+    for start in range(split, n_events, batch_size):
+        batch = events.iloc[start:start + batch_size].reset_index(drop=True)
+        truth |= set(zip(batch.loc[batch['injected'], 'timestamp'], batch.loc[batch['injected'], 'user_id']))
+
+        begin = time.perf_counter()
+        full_flags |= flagged(detector.score_batch(batch))
+        full_seconds += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        masks = prefilter.candidates(batch)
+        prefilter_seconds += time.perf_counter() - begin
+        begin = time.perf_counter()
+        cascade_flags |= flagged(cascade.score_batch(batch, candidates=masks['behavioral']))
+        cascade_seconds += time.perf_counter() - begin
+        for tier, mask in masks.items():
+            kept[tier] += int((mask & batch['injected'].to_numpy()).sum())
+
+    n_injected = int(injected.sum())
+    results = {
+        'n_events': n_events - split,
+        'n_injected': n_injected,
+        'pruned_fraction': {tier: round(value, 4) for tier, value in prefilter.pruned_fraction().items()},
+        'prefilter_recall': {tier: round(count / max(n_injected, 1), 4) for tier, count in kept.items()},
+        'behavioral': {
+            'recall_full': round(len(full_flags & truth) / max(len(truth), 1), 4),
+            'recall_cascade': round(len(cascade_flags & truth) / max(len(truth), 1), 4),
+            'flags_retained': round(len(cascade_flags & full_flags) / max(len(full_flags), 1), 4),
+            'seconds_full': round(full_seconds, 3),
+            'seconds_cascade': round(cascade_seconds, 3)
+        },
+        'prefilter_seconds': round(prefilter_seconds, 3)  # all three tiers
+    }
+    logger.info(f"prefilter_recall: {results}")
+    return results
+
+@benchmark("incremental_retrain")
+def bench_incremental_retrain(n_users: int = 500, n_events: int = 100000, changed_fraction: float = 0.05,
+                              history_days: int = 30, epochs: int = 5) -> Dict[str, Any]:
+    """Nightly retrain cost: full training vs retrain() when only a small slice of data is new"""
+    from ml_anomaly_detection import BehavioralAnomalyDetector, TimeSeriesAnomalyDetector
+
+    results = {}
+
+    # Behavioral: re-submit the same window plus one new event for a few users
+    events = synthetic_user_events(n_events, n_users)
+    detector = BehavioralAnomalyDetector()
+    full_seconds = _timed(detector.train, events)
+    rng = np.random.default_rng(3)
+    changed_users = rng.choice(events['user_id'].unique(), int(n_users * changed_fraction), replace=False)
+    new_events = events[events['user_id'].isin(changed_users)].groupby('user_id').tail(1).copy()
+    new_events['timestamp'] += pd.Timedelta(minutes=1)
+    results['behavioral'] = {
+        'users_changed': len(changed_users),
+        'full_train_seconds': round(full_seconds, 3),
+        'retrain_seconds': round(_timed(detector.retrain, pd.concat([events, new_events], ignore_index=True)), 3)
+    }
+    logger.info(f"incremental_retrain behavioral: {results['behavioral']}")
+
+    # LSTM: train on the full history vs fine-tune on the newest day
+    minutes = np.arange((history_days + 1) * 1440)
+    metrics = pd.DataFrame({'cpu': np.sin(2 * np.pi * minutes / 1440) + 0.1 * rng.normal(size=len(minutes))},
+                           index=pd.date_range('2024-01-01', periods=len(minutes), freq='min'))
+    history, new_day = metrics.iloc[:-1440], metrics.iloc[-1440:]
+    ts_detector = TimeSeriesAnomalyDetector(batch_size=256)
+    results['time_series'] = {
+        'history_rows': len(history),
+        'new_rows': len(new_day),
+        'full_train_seconds': round(_timed(ts_detector.train, history, epochs=epochs), 3),
+        'retrain_seconds': round(_timed(ts_detector.retrain, new_day, epochs=epochs), 3)
+    }
+    logger.info(f"incremental_retrain time_series: {results['time_series']}")
+    return results
+
+@benchmark("profiler_overhead")
+def bench_profiler_overhead(n_stages: int = 200000, n_users: int = 200, n_events: int = 20000,
+                            batch_size: int = 1000, repeats: int = 10) -> Dict[str, Any]:
+    """Cost of pipeline instrumentation: per-stage overhead and behavioral batch latency, off vs on"""
+    from ml_anomaly_detection import BehavioralAnomalyDetector, PipelineProfiler
+
+    results = {'stage_ns': {}, 'behavioral_batch_ms': {}}
+    for label, enabled in (('disabled', False), ('enabled', True)):
+        profiler = PipelineProfiler(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(n_stages):
+            with profiler.stage('noop'):
+                pass
+        results['stage_ns'][label] = round((time.perf_counter() - start) / n_stages * 1e9, 1)
+
+    events = synthetic_user_events(n_events, n_users)
+    detector = BehavioralAnomalyDetector(mode='population')
+    detector.train(events)
+    batch = events.iloc[:batch_size]
+    for label, enabled in (('disabled', False), ('enabled', True)):
+        detector.profiler = PipelineProfiler(enabled=enabled)
+        detector.score_batch(batch)
+        samples = [_timed(detector.score_batch, batch) * 1000 for _ in range(repeats)]
+        results['behavioral_batch_ms'][label] = round(float(np.median(samples)), 3)
+    logger.info(f"profiler_overhead: {results}")
+    return results
+
+@benchmark("arrow_ingest")
+def bench_arrow_ingest(n_events: int = 100000, repeats: int = 5) -> Dict[str, Any]:
+    """Engine frame build per input format, plus behavioral scoring on each, and Parquet replay read rate"""
+    import tempfile
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from ml_anomaly_detection import AnomalyDetectionEngine, BehavioralAnomalyDetector
+
+    events = next(iter_synthetic_workload(n_events, chunk_size=n_events)).drop(columns=['injected', 'anomaly_kind'])
+    engine = AnomalyDetectionEngine({'enable_time_series': False, 'enable_log_analysis': False})
+    inputs = {
+        'dicts': events.assign(timestamp=events['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S.%f')).to_dict('records'),
+        'arrow_string_timestamps': pa.Table.from_pandas(
+            events.assign(timestamp=events['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S.%f')), preserve_index=False),
+        'arrow': pa.Table.from_pandas(events, preserve_index=False)
+    }
+    detector = BehavioralAnomalyDetector(mode='population')
+    detector.train(engine._events_to_frame(inputs['arrow']))
+
+    results = {'n_events': n_events, 'frame_ms': {}, 'behavioral_ms': {}}
+    for label, payload in inputs.items():
+        frame = engine._events_to_frame(payload)
+        results['frame_ms'][label] = round(min(_timed(engine._events_to_frame, payload)
+                                               for _ in range(repeats)) * 1000, 2)
+        results['behavioral_ms'][label] = round(_timed(detector.score_batch, frame) * 1000, 2)
+
+    # Chunked replay read: one Parquet file per day
+    with tempfile.TemporaryDirectory() as directory:
+        for day, rows in events.groupby(events['timestamp'].dt.date):
+            pq.write_table(pa.Table.from_pandas(rows, preserve_index=False), os.path.join(directory, f"{day}.parquet"))
+        start = time.perf_counter()
+        chunks = engine._coalesce_batches(ds.dataset(directory, format='parquet').to_batches(batch_size=10000), 10000)
+        rows = sum(len(engine._events_to_frame(chunk)) for chunk in chunks)
+        results['replay_read_events_per_sec'] = round(rows / (time.perf_counter() - start), 1)
+    engine.close()
+    logger.info(f"arrow_ingest: {results}")
+    return results
+
+@benchmark("ann_index")
+def bench_ann_index(n_vectors: int = 1000000, dim: int = 128, n_queries: int = 200, k: int = 3,
+                    nprobes: tuple = (4, 8, 16), budget_ms: float = 1.0, min_recall: float = 0.95) -> Dict[str, Any]:
+    """
+    IVF neighbor index: build time, single-query latency and recall@k against exact search
+
+    Passes when the default nprobe has a p50 under ``budget_ms`` and recall@k
+    of at least ``min_recall``.
+    """
+    from ml_anomaly_detection import IVFIndex
+
+    rng = np.random.default_rng(11)
+    centers = rng.normal(size=(max(n_vectors // 100, 1), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n_vectors)]
+    vectors += 0.3 * rng.standard_normal(vectors.shape, dtype=np.float32)
+    queries = vectors[rng.choice(n_vectors, n_queries, replace=False)]
+    queries += 0.1 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    index = IVFIndex()
+    start = time.perf_counter()
+    index.add(vectors, np.arange(n_vectors).astype(str).tolist())
+    index.merge()
+    results = {'n_vectors': n_vectors, 'dim': dim, 'k': k, 'n_lists': len(index.centroids),
+               'build_seconds': round(time.perf_counter() - start, 3), 'default_nprobe': index.nprobe,
+               'budget_ms': budget_ms, 'nprobe': {}}
+
+    # Exact neighbors by brute force, one query at a time
+    norms = np.einsum('ij,ij->i', vectors, vectors)
+    exact = []
+    for query in queries:
+        distances = norms - 2 * vectors @ query
+        exact.append(set(np.argpartition(distances, k)[:k].astype(str).tolist()))
+
+    for nprobe in sorted(set(nprobes) | {index.nprobe}):
+        index.nprobe = nprobe
+        samples, hits = [], 0
+        for query, truth in zip(queries, exact):
+            begin = time.perf_counter()
+            _, labels = index.search(query, k)
+            samples.append((time.perf_counter() - begin) * 1000)
+            hits += len(truth & set(labels[0]))
+        results['nprobe'][str(nprobe)] = {
+            'p50_ms': round(float(np.median(samples)), 3),
+            'p99_ms': round(float(np.percentile(samples, 99)), 3),
+            'recall_at_k': round(hits / (k * n_queries), 4)
+        }
+        logger.info(f"ann_index nprobe={nprobe}: {results['nprobe'][str(nprobe)]}")
+    default = results['nprobe'][str(results['default_nprobe'])]
+    results['passed'] = default['p50_ms'] <= budget_ms and default['recall_at_k'] >= min_recall
+    return results
+
+def _measure_workload(batches: Iterator[pd.DataFrame], score: Callable[[Any], List[Any]],
+                      kind: Optional[str] = None, prepare: Callable[[pd.DataFrame], Any] = None) -> Dict[str, Any]:
+    """
+    Score every batch and compare the flagged rows with the injected ground truth
+
+    ``score`` returns AnomalyBatch or AnomalyResult objects; flagged rows are
+    matched back to events by timestamp. Recall counts injected rows of
+    ``kind`` (every kind when None), precision counts any injected row.
+    ``prepare`` converts a batch outside the timed region.
+    """
+    latencies, peak_rss = [], _rss_mb()
+    events = flagged = true_positives = found = relevant = 0
+    for batch in batches:
+        payload = prepare(batch) if prepare else batch
+        begin = time.perf_counter()
+        output = score(payload)
+        latencies.append(time.perf_counter() - begin)
+        peak_rss = max(peak_rss, _rss_mb())
+
+        timestamps = []
+        for item in output:
+            if hasattr(item, 'anomalies'):
+                timestamps.extend(item.anomalies().timestamps)
+            elif item.is_anomaly:
+                timestamps.append(item.timestamp)
+        hits = np.unique(pd.DatetimeIndex(timestamps).as_unit('ns').asi8) if timestamps else np.empty(0, dtype=np.int64)
+        stamps = pd.DatetimeIndex(batch['timestamp']).as_unit('ns').asi8
+        injected = batch['injected'].to_numpy()
+        target = injected if kind is None else (batch['anomaly_kind'].to_numpy() == kind)
+
+        events += len(batch)
+        flagged += len(hits)
+        true_positives += int(np.isin(hits, stamps[injected]).sum())
+        found += int(np.isin(stamps[target], hits).sum())
+        relevant += int(target.sum())
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'events': events,
+        'events_per_sec': round(events / max(float(np.sum(latencies)), 1e-9), 1),
+        'batch_latency_ms': {q: round(float(np.percentile(latencies_ms, p)), 3)
+                             for q, p in (('p50', 50), ('p95', 95), ('p99', 99))},
+        'peak_rss_mb': round(peak_rss, 1),
+        'flagged': flagged,
+        'injected': relevant,
+        'precision': round(true_positives / flagged, 4) if flagged else None,
+        'recall': round(found / relevant, 4) if relevant else None
+    }
+
+def run_workload(n_events: int, detectors: tuple = ('time_series_bank', 'log_analysis', 'behavioral'),
+                 batch_size: int = 1000, train_events: Optional[int] = None, anomaly_rate: float = 0.005,
+                 epochs: int = 3, engine_config: Optional[Dict[str, Any]] = None,
+                 seed: int = 42) -> Dict[str, Any]:
+    """
+    Train on a clean prefix of a synthetic workload, then score n_events through
+    each detector and through AnomalyDetectionEngine.process_events
+
+    A detector's recall only counts the anomaly kind it can see (metric spikes
+    for the time series bank, novel templates for logs, behavioral outliers
+    for users); the engine is measured against every injected row. Results
+    go to an in-process fakeredis, so the store stage excludes network time.
+    """
+    import asyncio
+    import resource
+    import tempfile
+    import fakeredis
+    from ml_anomaly_detection import AnomalyDetectionEngine, BehavioralWindowStore
+
+    train_events = train_events or min(max(n_events // 5, 10000), 200000)
+    total = train_events + n_events
+    config = {'enable_time_series': False, 'behavioral_mode': 'population'}
+    config.update({f'enable_{name}': name in detectors
+                   for name in ('time_series_bank', 'log_analysis', 'behavioral')})
+    config.update(engine_config or {})
+    engine = AnomalyDetectionEngine(config)
+    engine.redis_client = fakeredis.FakeRedis()
+
+    def workload() -> Iterator[pd.DataFrame]:
+        return iter_synthetic_workload(total, anomaly_rate=anomaly_rate, clean_events=train_events, seed=seed)
+
+    def scoring_batches() -> Iterator[pd.DataFrame]:
+        """The events after the training prefix, batch_size rows at a time"""
+        for chunk in workload():
+            chunk = chunk[chunk['event_id'].to_numpy() >= train_events]
+            for offset in range(0, len(chunk), batch_size):
+                yield chunk.iloc[offset:offset + batch_size]
+
+    # Train on the clean prefix
+    training = []
+    for chunk in workload():
+        training.append(chunk[chunk['event_id'].to_numpy() < train_events])
+        if chunk['event_id'].iloc[-1] >= train_events - 1:
+            break
+    training = pd.concat(training, ignore_index=True)
+    train_seconds = {}
+    if 'time_series_bank' in engine.detectors:
+        train_seconds['time_series_bank'] = _timed(engine.detectors['time_series_bank'].train, training, epochs=epochs)
+    if 'log_analysis' in engine.detectors:
+        train_seconds['log_analysis'] = _timed(engine.detectors['log_analysis'].train,
+                                               training['log_message'].tolist())
+    if 'behavioral' in engine.detectors:
+        train_seconds['behavioral'] = _timed(engine.detectors['behavioral'].train, training)
+    del training
+
+    # Scoring advances streaming state, so every pass starts from what training left
+    snapshot = tempfile.TemporaryDirectory()
+    window_store = getattr(engine.detectors.get('behavioral'), 'window_store', None)
+    if window_store is not None:
+        window_store.save(snapshot.name)
+
+    def reset_streams():
+        for detector in engine.detectors.values():
+            if hasattr(detector, 'reset_stream'):
+                detector.reset_stream()
+        if window_store is not None:
+            engine.detectors['behavioral'].window_store = BehavioralWindowStore.load(snapshot.name)
+
+    scorers = {
+        'time_series_bank': ('metric', lambda batch: [engine.detectors['time_series_bank'].score_batch(batch)]),
+        'log_analysis': ('log', lambda batch: [engine.detectors['log_analysis'].score_batch(
+            batch['log_message'].tolist(), batch['timestamp'].tolist())]),
+        'behavioral': ('behavioral', lambda batch: [engine.detectors['behavioral'].score_batch(batch)])
+    }
+    columns = ['timestamp', 'user_id', 'event_type', 'source_ip', 'destination_ip', 'bytes_transferred',
+               'host', 'metric_name', 'metric_value', 'log_message']
+
+    def to_records(batch: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Engine input: JSON-like dicts with ISO timestamps"""
+        return batch[columns].assign(timestamp=batch['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S.%f')).to_dict('records')
+
+    results = {'n_events': n_events, 'train_events': train_events, 'batch_size': batch_size,
+               'anomaly_rate': anomaly_rate, 'detectors': {}}
+    for name, detector in engine.detectors.items():
+        kind, score = scorers[name]
+        reset_streams()
+        results['detectors'][name] = {'train_seconds': round(train_seconds[name], 3),
+                                      **_measure_workload(scoring_batches(), score, kind)}
+        logger.info(f"workload {n_events} {name}: {results['detectors'][name]}")
+
+    reset_streams()
+    results['engine'] = _measure_workload(
+        scoring_batches(), lambda records: asyncio.run(engine.process_events(records, anomalies_only=True)),
+        prepare=to_records)
+    logger.info(f"workload {n_events} engine: {results['engine']}")
+    snapshot.cleanup()
+    results['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+@benchmark("workload_10k")
+def bench_workload_10k() -> Dict[str, Any]:
+    """End-to-end synthetic SIEM workload, 10k scored events"""
+    return run_workload(10000)
+
+@benchmark("workload_1m")
+def bench_workload_1m() -> Dict[str, Any]:
+    """End-to-end synthetic SIEM workload, 1M scored events"""
+    return run_workload(1000000)
+
+@benchmark("workload_10m")
+def bench_workload_10m() -> Dict[str, Any]:
+    """End-to-end synthetic SIEM workload, 10M scored events"""
+    return run_workload(10000000)
+
+# Too slow for the default run; only executed when named explicitly
+OPT_IN_BENCHMARKS = {'workload_1m', 'workload_10m'}
+
+HEAVY_MODULES = ('tensorflow', 'torch', 'transformers', 'sklearn', 'elasticsearch', 'kafka', 'redis')
+
+@benchmark("import_time")
+def bench_import_time(budget_ms: float = 1500.0, runs: int = 3) -> Dict[str, Any]:
+    """Cold `import ml_anomaly_detection` time from `python -X importtime`, checked against a budget"""
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    probe = ("import sys, ml_anomaly_detection; "
+             f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    timings, heavy_loaded = [], set()
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], cwd=module_dir,
+                                   capture_output=True, text=True, check=True)
+        # Last matching line: "import time: self [us] | cumulative | ml_anomaly_detection"
+        cumulative_us = [int(line.split('|')[1]) for line in completed.stderr.splitlines()
+                         if line.rstrip().endswith('| ml_anomaly_detection')][-1]
+        timings.append(cumulative_us / 1000)
+        heavy_loaded.update(name for name in completed.stdout.strip().split(',') if name)
+
+    results = {
+        'budget_ms': budget_ms,
+        'import_ms': round(min(timings), 1),
+        'import_ms_runs': [round(t, 1) for t in timings],
+        'heavy_modules_loaded': sorted(heavy_loaded),
+    }
+    results['passed'] = results['import_ms'] <= budget_ms and not heavy_loaded
+    logger.info(f"import_time: {results}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SIEM ML anomaly detection module")
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f"Benchmarks to run (default: all): {', '.join(sorted(BENCHMARKS))}")
+    parser.add_argument('--output', help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    selected = args.benchmarks or sorted(set(BENCHMARKS) - OPT_IN_BENCHMARKS)
+    report = {name: BENCHMARKS[name]() for name in selected}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+    failed = [name for name, result in report.items() if result.get('passed') is False]
+    if failed:
+        logger.error(f"Benchmarks over budget: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""
+Shared pytest setup for the ML anomaly detection module
+
+The modules under test live one directory up and are imported as top-level
+modules, the same way ml_benchmarks.py imports them.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
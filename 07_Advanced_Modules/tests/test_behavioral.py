@@ -0,0 +1,42 @@
+"""Tests for BehavioralAnomalyDetector"""
+
+import numpy as np
+
+from ml_anomaly_detection import BehavioralAnomalyDetector
+from ml_benchmarks import synthetic_user_events
+
+def false_positive_rate(detector: BehavioralAnomalyDetector, events, batch_size: int) -> float:
+    """Fraction of (normal) events flagged when scored batch_size rows at a time"""
+    flags = [detector.score_batch(events.iloc[start:start + batch_size]).is_anomaly
+             for start in range(0, len(events), batch_size)]
+    return float(np.concatenate(flags).mean())
+
+def test_population_false_positives_do_not_depend_on_batch_size():
+    """Micro-batches of normal traffic are flagged at the rate the full window is"""
+    training = synthetic_user_events(20000, 50, seed=1, start='2024-01-01')
+    normal = synthetic_user_events(10000, 50, seed=2, start='2024-01-31')
+
+    # Scoring advances the live window state, so each batch size gets a freshly trained detector
+    rates = {}
+    for batch_size in (10000, 1000, 100):
+        detector = BehavioralAnomalyDetector(mode='population')
+        detector.train(training)
+        rates[batch_size] = false_positive_rate(detector, normal, batch_size)
+    assert max(rates.values()) <= 0.2, rates
+    assert max(rates.values()) - min(rates.values()) <= 0.02, rates
+
+def test_scoring_does_not_grow_the_vocabularies():
+    """Unseen users and event types get batch-local codes but keep their values in the output"""
+    detector = BehavioralAnomalyDetector(mode='population')
+    detector.train(synthetic_user_events(5000, 20, seed=1))
+    sizes = {column: len(vocabulary) for column, vocabulary in detector.vocabularies.items()}
+
+    for batch in range(3):
+        events = synthetic_user_events(200, 20, seed=2 + batch, start='2024-01-31')
+        events.loc[:49, 'user_id'] = [f'attacker{batch}-{i}' for i in range(50)]
+        events.loc[:9, 'event_type'] = f'probe{batch}'
+        scored = detector.score_batch(events)
+        features = scored._features(np.arange(len(scored)))
+        assert {row['user_id'] for row in features} == set(events['user_id'])
+        assert {row['event_type'] for row in features} == set(events['event_type'])
+    assert {column: len(vocabulary) for column, vocabulary in detector.vocabularies.items()} == sizes
@@ -0,0 +1,34 @@
+"""Tests for AnomalyDetectionEngine input conversion (dicts, DataFrames and Arrow)"""
+
+import pandas as pd
+import pytest
+
+from ml_anomaly_detection import AnomalyDetectionEngine
+
+@pytest.fixture
+def engine() -> AnomalyDetectionEngine:
+    engine = AnomalyDetectionEngine({'enable_time_series': False, 'enable_log_analysis': False,
+                                     'enable_behavioral': False})
+    yield engine
+    engine.close()
+
+@pytest.mark.parametrize('timestamps, hours', [
+    (['2024-01-01T21:53:42', '2024-01-02T01:00:00'], [21, 1]),              # naive: kept as given
+    (['2024-01-01T21:53:42Z', '2024-01-02T01:00:00Z'], [21, 1]),
+    (['2024-01-01T21:00:00+02:00', '2024-01-01T22:30:00+02:00'], [19, 20]),  # offsets become UTC
+    (['2024-03-30T21:00:00+01:00', '2024-04-01T22:00:00+02:00'], [20, 20]),  # mixed offsets (DST change)
+    (['01/02/2024 10:00', '01/03/2024 11:00'], [10, 11]),                   # not ISO: pandas parses it
+])
+def test_timestamps_parse_the_same_on_every_input_path(engine, timestamps, hours):
+    """Dicts, DataFrames and Arrow tables give the same instants and hour of day"""
+    pa = pytest.importorskip('pyarrow')
+    records = [{'timestamp': timestamp, 'user_id': 'alice'} for timestamp in timestamps]
+    frames = {
+        'dicts': engine._events_to_frame(records),
+        'dataframe': engine._events_to_frame(pd.DataFrame(records)),
+        'arrow': engine._events_to_frame(pa.Table.from_pylist(records)),
+        'record_batch': engine._events_to_frame(pa.RecordBatch.from_pylist(records)),
+    }
+    for path, frame in frames.items():
+        assert frame['timestamp'].dt.hour.tolist() == hours, path
+        assert frame['timestamp'].tolist() == frames['dicts']['timestamp'].tolist(), path
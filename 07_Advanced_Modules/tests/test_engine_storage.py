@@ -0,0 +1,67 @@
+"""Tests for AnomalyDetectionEngine result storage in Redis (keys and sorted-set indexes)"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_anomaly_detection import AnomalyBatch, AnomalyDetectionEngine, AnomalyResult
+
+@pytest.fixture
+def engine() -> AnomalyDetectionEngine:
+    fakeredis = pytest.importorskip('fakeredis')
+    engine = AnomalyDetectionEngine({'enable_time_series': False, 'enable_log_analysis': False,
+                                     'enable_behavioral': False})
+    engine.redis_client = fakeredis.FakeRedis()
+    yield engine
+    engine.close()
+
+def anomaly(timestamp: datetime, source: str = 'behavioral_analysis') -> AnomalyResult:
+    return AnomalyResult(timestamp=timestamp, source=source, anomaly_score=0.3, is_anomaly=True, confidence=0.3,
+                         features={'user_id': 'alice'}, explanation="test", severity="medium")
+
+def index_sizes(engine: AnomalyDetectionEngine) -> list:
+    return [engine.redis_client.zcard(index)
+            for index in (engine.TIME_INDEX, engine.SCORE_INDEX, engine.EXPIRY_INDEX)]
+
+def test_replayed_anomalies_stay_indexed_while_their_keys_live(engine):
+    """Old event times (backfill, late events) do not trim members whose keys were just written"""
+    now = datetime.now()
+    asyncio.run(engine.store_results([anomaly(now - timedelta(days=3))]))
+    asyncio.run(engine.store_results([anomaly(now)]))
+    assert index_sizes(engine) == [2, 2, 2]
+    assert len(engine.query_anomalies()) == 2
+
+def test_index_members_are_trimmed_when_their_keys_expire(engine):
+    engine.anomaly_ttl = 1
+    asyncio.run(engine.store_results([anomaly(datetime.now(), 'first')]))
+    time.sleep(1.1)
+    asyncio.run(engine.store_results([anomaly(datetime.now() - timedelta(days=3), 'second')]))
+    assert index_sizes(engine) == [1, 1, 1]
+    assert [record['source'] for record in engine.top_anomalies()] == ['second']
+
+def test_batches_are_stored_like_results_with_rows_built_only_when_written(engine):
+    """store_batches writes what store_results writes, asking the batch for features of flagged rows only"""
+    fakeredis = pytest.importorskip('fakeredis')
+    rng = np.random.default_rng(3)
+    scores = rng.random(1000)
+    requested = []
+
+    def features(rows):
+        requested.extend(rows.tolist())
+        return [{'user_id': f'user{row}'} for row in rows]
+
+    batch = AnomalyBatch("behavioral_analysis", pd.date_range('2024-01-01', periods=1000, freq='s').array,
+                         scores, scores > 0.99, 1 - scores, (scores > 0.995).astype(np.int8),
+                         features, lambda rows: [f"row {row}" for row in rows])
+    asyncio.run(engine.store_batches([batch]))
+    assert sorted(requested) == np.flatnonzero(scores > 0.99).tolist()
+
+    stored = {key: engine.redis_client.get(key) for key in engine.redis_client.keys('anomaly:*')}
+    engine.redis_client = fakeredis.FakeRedis()
+    asyncio.run(engine.store_results(batch.anomalies().to_results()))
+    assert stored == {key: engine.redis_client.get(key) for key in engine.redis_client.keys('anomaly:*')}
+    assert len(stored) == int((scores > 0.99).sum())
@@ -0,0 +1,57 @@
+"""Tests for IVFIndex: recall@k against brute-force search"""
+
+import numpy as np
+import pytest
+
+from ml_anomaly_detection import IVFIndex
+
+K = 3
+
+@pytest.fixture(scope='module')
+def clustered():
+    """Clustered vectors (like template embeddings), noisy queries near them and exact top-k labels"""
+    rng = np.random.default_rng(11)
+    centers = rng.normal(size=(200, 32)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), 50000)]
+    vectors += 0.3 * rng.standard_normal(vectors.shape, dtype=np.float32)
+    queries = vectors[rng.choice(len(vectors), 200, replace=False)]
+    queries += 0.1 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    squared = (np.einsum('ij,ij->i', vectors, vectors)[None, :] - 2 * queries @ vectors.T
+               + np.einsum('ij,ij->i', queries, queries)[:, None])
+    exact = np.argsort(squared, axis=1)[:, :K]
+    labels = np.arange(len(vectors)).astype(str).tolist()
+    return vectors, labels, queries, exact, np.sqrt(np.maximum(np.take_along_axis(squared, exact, axis=1), 0))
+
+def recall(index: IVFIndex, queries: np.ndarray, exact: np.ndarray) -> float:
+    _, found = index.search(queries, K)
+    hits = sum(len(set(row) & set(truth.astype(str))) for row, truth in zip(found, exact))
+    return hits / exact.size
+
+def test_recall_at_k_with_default_probes(clustered):
+    vectors, labels, queries, exact, _ = clustered
+    index = IVFIndex()
+    index.add(vectors, labels)
+    index.merge()
+    assert index.centroids is not None  # the quantizer is trained, so search is approximate
+    assert recall(index, queries, exact) >= 0.95
+
+def test_probing_every_cell_is_exact(clustered):
+    vectors, labels, queries, exact, exact_distances = clustered
+    index = IVFIndex()
+    index.add(vectors, labels)
+    index.merge()
+    index.nprobe = len(index.centroids)
+    distances, _ = index.search(queries, K)
+    assert recall(index, queries, exact) == 1.0
+    np.testing.assert_allclose(distances, exact_distances, rtol=1e-3, atol=1e-3)
+
+def test_pending_inserts_are_searched_before_merge(clustered):
+    """Vectors still in the insert buffer are found like merged ones"""
+    vectors, labels, queries, exact, _ = clustered
+    index = IVFIndex(merge_threshold=len(vectors))
+    index.add(vectors[:45000], labels[:45000])
+    index.merge()
+    index.add(vectors[45000:], labels[45000:])
+    assert index._pending
+    assert recall(index, queries, exact) >= 0.95
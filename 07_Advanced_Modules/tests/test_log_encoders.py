@@ -0,0 +1,64 @@
+"""Tests for the LogAnomalyDetector encoder backends"""
+
+import os
+
+import numpy as np
+import pytest
+
+from ml_anomaly_detection import LogAnomalyDetector
+from ml_benchmarks import synthetic_log_corpus
+
+VOCABULARY = (["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + list("abcdefghijklmnopqrstuvwxyz0123456789.:;=/()[]-_")
+              + ["user", "failed", "password", "for", "from", "port", "session", "opened", "sudo", "ssh2"])
+
+@pytest.fixture(scope='module', params=['distilbert', 'bert'])
+def checkpoint(request, tmp_path_factory) -> str:
+    """A tiny randomly initialised checkpoint with its tokenizer, written locally (no downloads)"""
+    transformers = pytest.importorskip('transformers')
+    torch = pytest.importorskip('torch')
+    path = tmp_path_factory.mktemp(request.param)
+    (path / 'vocab.txt').write_text('\n'.join(VOCABULARY))
+    transformers.BertTokenizerFast(str(path / 'vocab.txt')).save_pretrained(str(path))
+    torch.manual_seed(0)
+    if request.param == 'distilbert':
+        model = transformers.DistilBertModel(transformers.DistilBertConfig(
+            vocab_size=len(VOCABULARY), dim=32, hidden_dim=64, n_layers=2, n_heads=2))
+    else:
+        model = transformers.BertModel(transformers.BertConfig(
+            vocab_size=len(VOCABULARY), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=2))
+    model.save_pretrained(str(path))
+    return str(path)
+
+def test_onnx_embeddings_match_torch(checkpoint, tmp_path):
+    """The exported ONNX encoder returns the fp32 torch embeddings for every batch and sequence shape"""
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    logs = synthetic_log_corpus(200)
+    reference = LogAnomalyDetector(checkpoint, batch_size=7, use_templates=False).encode(logs)
+    onnx = LogAnomalyDetector(checkpoint, batch_size=7, use_templates=False, encoder_backend='onnx',
+                              onnx_path=str(tmp_path / 'encoder.onnx')).encode(logs)
+    np.testing.assert_allclose(onnx, reference, atol=1e-4)
+
+def test_onnx_export_goes_to_a_private_cache_and_is_atomic(checkpoint, tmp_path, monkeypatch):
+    """The default export lands in a 0700 per-user cache; a failed export leaves nothing behind"""
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    import torch
+    from ml_anomaly_detection import OnnxTransformerEncoder
+
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    cache = tmp_path / 'siem-ml' / 'onnx'
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("export crashed")
+    with monkeypatch.context() as patch:
+        patch.setattr(torch.onnx, 'export', crash)
+        with pytest.raises(RuntimeError):
+            OnnxTransformerEncoder(checkpoint)
+    assert list(cache.iterdir()) == []
+
+    encoder = OnnxTransformerEncoder(checkpoint)
+    assert os.path.dirname(encoder.onnx_path) == str(cache)
+    assert cache.stat().st_mode & 0o777 == 0o700
+    assert [path.name for path in cache.iterdir()] == [os.path.basename(encoder.onnx_path)]
@@ -0,0 +1,49 @@
+"""Tests for LogTemplateMiner and template use by LogAnomalyDetector (learned in training, read at scoring)"""
+
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from ml_anomaly_detection import LogAnomalyDetector, LogTemplateMiner
+from ml_benchmarks import synthetic_log_corpus
+
+def trained_miner() -> LogTemplateMiner:
+    miner = LogTemplateMiner()
+    for message in ("Failed password for alice from 10.0.0.1 port 22 ssh2",
+                    "Failed password for bob from 10.0.0.2 port 2222 ssh2",
+                    "session opened for user root"):
+        miner.assign(message)
+    return miner
+
+def test_match_finds_learned_templates_without_changing_them():
+    miner = trained_miner()
+    state = pickle.dumps(miner)
+    cluster_id, template = miner.match("Failed password for mallory from 192.168.1.5 port 22 ssh2")
+    assert (cluster_id, template) == (0, "Failed password for <*> from <IP> port <NUM> ssh2")
+    assert miner.match("session opened for user root") == (1, "session opened for user root")
+    assert pickle.dumps(miner) == state
+
+def test_match_does_not_generalize_or_create_clusters():
+    """Lines a learned template does not cover keep their own masked text"""
+    miner = trained_miner()
+    state = pickle.dumps(miner)
+    assert miner.match("session opened for user mallory") == (-1, "session opened for user mallory")
+    assert miner.match("kernel: segfault at 0x7f3a") == (-1, "kernel: segfault at <HEX>")
+    assert miner.match("") == (-1, "")
+    assert pickle.dumps(miner) == state
+
+def test_scoring_leaves_learned_templates_alone(monkeypatch):
+    """Only training and add_normal_logs mine templates; scoring untrusted logs only reads them"""
+    detector = LogAnomalyDetector(neighbor_index=True)
+    monkeypatch.setattr(detector, 'encode', lambda texts: np.array(
+        [[len(text), text.count('<'), sum(map(ord, text)) % 97] for text in texts], dtype=np.float32))
+    detector.train(synthetic_log_corpus(500))
+    state = pickle.dumps(detector.template_miner)
+
+    attack = [f"session opened for user attacker{i} by evil-{i}" for i in range(50)]
+    detector.score_batch(synthetic_log_corpus(200) + attack, pd.date_range('2024-01-01', periods=250, freq='s'))
+    assert pickle.dumps(detector.template_miner) == state
+
+    detector.add_normal_logs(attack)
+    assert pickle.dumps(detector.template_miner) != state
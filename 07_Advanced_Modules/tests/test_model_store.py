@@ -0,0 +1,50 @@
+"""Tests for ModelArtifactStore versions and the legacy (un-versioned) model layout"""
+
+import os
+
+import joblib
+import numpy as np
+import pytest
+
+from ml_anomaly_detection import AnomalyDetectionEngine, BehavioralAnomalyDetector, ModelArtifactStore
+from ml_benchmarks import synthetic_user_events
+
+@pytest.fixture(scope='module')
+def detector() -> BehavioralAnomalyDetector:
+    detector = BehavioralAnomalyDetector()
+    detector.train(synthetic_user_events(2000, 10, seed=1))
+    return detector
+
+def test_keep_versions_prunes_the_oldest(tmp_path, detector):
+    store = ModelArtifactStore(str(tmp_path), keep_versions=2)
+    saved = [store.save({'behavioral': detector}) for _ in range(4)]
+    assert store.versions() == saved[-2:]
+    assert store.latest() == saved[-1]
+    assert sorted(os.listdir(tmp_path)) == [ModelArtifactStore.LATEST_FILE] + saved[-2:]
+
+def test_versions_are_kept_by_default(tmp_path, detector):
+    store = ModelArtifactStore(str(tmp_path))
+    saved = [store.save({'behavioral': detector}) for _ in range(3)]
+    assert store.versions() == saved
+
+def test_keep_versions_must_keep_one():
+    with pytest.raises(ValueError):
+        ModelArtifactStore('unused', keep_versions=0)
+
+def test_legacy_layout_loads_per_user_models(tmp_path, detector):
+    """The flat files earlier releases wrote load into a population-configured engine as per-user models"""
+    joblib.dump(dict(detector.models), tmp_path / 'behavioral_models.pkl')
+    joblib.dump(dict(detector.scalers), tmp_path / 'behavioral_scalers.pkl')
+    engine = AnomalyDetectionEngine({'enable_time_series': False, 'enable_log_analysis': False,
+                                     'behavioral_mode': 'population'})
+    try:
+        engine.load_models(str(tmp_path))
+        loaded = engine.detectors['behavioral']
+        assert loaded.is_trained and loaded.mode == 'per_user' and loaded.window_store is None
+
+        events = synthetic_user_events(500, 10, seed=2, start='2024-01-31')
+        expected = detector.score_batch(events)
+        scored = loaded.score_batch(events)
+        np.testing.assert_array_equal(scored.anomaly_scores, expected.anomaly_scores)
+    finally:
+        engine.close()
@@ -0,0 +1,53 @@
+"""Tests for StatisticalPrefilter: how much traffic it prunes and the recall that costs"""
+
+import numpy as np
+import pandas as pd
+
+from ml_anomaly_detection import BehavioralAnomalyDetector, StatisticalPrefilter
+from ml_benchmarks import synthetic_user_events
+
+N_EVENTS = 40000
+BATCH_SIZE = 2000
+
+def flagged(batch) -> set:
+    """(timestamp, user) of every flagged row"""
+    anomalies = batch.anomalies()
+    return {(timestamp, features['user_id']) for timestamp, features
+            in zip(anomalies.timestamps, anomalies._features(anomalies.index))}
+
+def test_behavioral_cascade_keeps_recall():
+    """Injected behavioral anomalies survive the prefilter, and the cascade flags what the full pass flags"""
+    rng = np.random.default_rng(7)
+    events = synthetic_user_events(N_EVENTS, 200)
+    split = N_EVENTS // 2
+    injected = np.zeros(N_EVENTS, dtype=bool)
+    injected[split + rng.choice(N_EVENTS - split, (N_EVENTS - split) // 100, replace=False)] = True
+    events.loc[injected, 'source_ip'] = '203.0.113.' + pd.Series(rng.integers(1, 254, injected.sum())).astype(str).values
+    events.loc[injected, 'event_type'] = 'privilege_escalation'
+    events['injected'] = injected
+
+    # Scoring advances the window state, so the full pass and the cascade get their own detector
+    full, cascade = BehavioralAnomalyDetector(mode='population'), BehavioralAnomalyDetector(mode='population')
+    full.train(events.iloc[:split])
+    cascade.train(events.iloc[:split])
+    prefilter = StatisticalPrefilter()
+    for start in range(0, split, BATCH_SIZE):
+        prefilter.candidates(events.iloc[start:start + BATCH_SIZE])
+    prefilter.stats = {tier: {'rows': 0, 'candidates': 0} for tier in prefilter.TIERS}
+
+    kept, truth, full_flags, cascade_flags = 0, set(), set(), set()
+    for start in range(split, N_EVENTS, BATCH_SIZE):
+        batch = events.iloc[start:start + BATCH_SIZE].reset_index(drop=True)
+        is_injected = batch['injected'].to_numpy()
+        truth |= set(zip(batch.loc[is_injected, 'timestamp'], batch.loc[is_injected, 'user_id']))
+        candidates = prefilter.candidates(batch)['behavioral']
+        kept += int((candidates & is_injected).sum())
+        full_flags |= flagged(full.score_batch(batch))
+        cascade_flags |= flagged(cascade.score_batch(batch, candidates=candidates))
+
+    assert prefilter.pruned_fraction()['behavioral'] >= 0.5
+    assert kept / injected.sum() >= 0.95
+    recall_full = len(full_flags & truth) / len(truth)
+    recall_cascade = len(cascade_flags & truth) / len(truth)
+    assert recall_full > 0
+    assert recall_cascade >= recall_full - 0.02
@@ -0,0 +1,92 @@
+"""Tests for StreamingAnomalyRunner against the in-process broker from ml_benchmarks"""
+
+import asyncio
+
+import pytest
+
+from ml_anomaly_detection import AnomalyDetectionEngine, StreamingAnomalyRunner
+from ml_benchmarks import InMemoryBroker, synthetic_user_events
+
+N_EVENTS = 2000
+BATCH_SIZE = 500
+
+@pytest.fixture(scope='module')
+def engine() -> AnomalyDetectionEngine:
+    """Behavioral-only engine trained on synthetic events, storing results in fakeredis"""
+    fakeredis = pytest.importorskip('fakeredis')
+    engine = AnomalyDetectionEngine({'enable_time_series': False, 'enable_log_analysis': False})
+    engine.redis_client = fakeredis.FakeRedis()
+    engine.train_all_detectors({'user_events': synthetic_user_events(5000, 20, seed=1)})
+    yield engine
+    engine.close()
+
+@pytest.fixture
+def broker() -> InMemoryBroker:
+    broker = InMemoryBroker()
+    events = synthetic_user_events(N_EVENTS, 20, seed=2, start='2024-02-01')
+    for payload in events.assign(timestamp=events['timestamp'].astype(str)).to_dict('records'):
+        broker.publish('siem-events', payload)
+    return broker
+
+def make_runner(engine, broker, monkeypatch, max_in_flight: int, fail_on_batch: int = 0):
+    """
+    Runner whose engine calls and consumer commits are recorded
+
+    Each commit records (committed offset, events the engine had finished,
+    anomalies on the output topic). With ``fail_on_batch`` the engine raises
+    on that (1-based) batch instead of processing it.
+    """
+    calls, processed, commits = [], [0], []
+    process = engine.process_event_batches
+
+    async def recording_process(events, anomalies_only=False):
+        calls.append(len(events))
+        if len(calls) == fail_on_batch:
+            raise RuntimeError("detector crashed")
+        batches = await process(events, anomalies_only)
+        processed.append(processed[-1] + len(events))
+        return batches
+    monkeypatch.setattr(engine, 'process_event_batches', recording_process)
+
+    consumer = broker.consumer('siem-events')
+    commit = consumer.commit
+
+    def recording_commit(offsets):
+        commits.append((offsets[('siem-events', 0)].offset, processed[-1],
+                        len(broker.topics.get('siem-anomalies', []))))
+        commit(offsets)
+    consumer.commit = recording_commit
+
+    runner = StreamingAnomalyRunner(engine, consumer, broker.producer(), 'siem-anomalies',
+                                    max_batch_size=BATCH_SIZE, max_batch_latency=60, max_in_flight=max_in_flight,
+                                    poll_timeout_ms=1)
+    return runner, commits
+
+@pytest.mark.parametrize('max_in_flight', [1, 3])
+def test_offsets_are_committed_after_processing_and_producing(engine, broker, monkeypatch, max_in_flight):
+    """Every commit covers only processed events whose anomalies are already on the output topic"""
+    runner, commits = make_runner(engine, broker, monkeypatch, max_in_flight)
+    asyncio.run(runner.run(max_batches=N_EVENTS // BATCH_SIZE))
+    runner.close()
+
+    assert [offset for offset, _processed, _produced in commits] == list(range(BATCH_SIZE, N_EVENTS + 1, BATCH_SIZE))
+    for offset, processed, _produced in commits:
+        assert offset <= processed
+    produced = [produced for _offset, _processed, produced in commits]
+    assert produced == sorted(produced)
+    assert produced[-1] == runner.anomalies_produced == len(broker.topics['siem-anomalies'])
+    assert runner.events_processed == N_EVENTS
+    assert broker.committed['siem-events'] == N_EVENTS
+
+@pytest.mark.parametrize('max_in_flight', [1, 3])
+def test_failed_batch_is_not_committed_and_is_replayed(engine, broker, monkeypatch, max_in_flight):
+    """A crash on batch 2 leaves the commit after batch 1, so a new consumer resumes from batch 2"""
+    runner, commits = make_runner(engine, broker, monkeypatch, max_in_flight, fail_on_batch=2)
+    with pytest.raises(RuntimeError, match="detector crashed"):
+        asyncio.run(runner.run(max_batches=N_EVENTS // BATCH_SIZE))
+    runner.close()
+
+    assert [offset for offset, _processed, _produced in commits] == [BATCH_SIZE]
+    assert broker.committed['siem-events'] == BATCH_SIZE
+    replay = broker.consumer('siem-events').poll(max_records=1)
+    assert replay[('siem-events', 0)][0].offset == BATCH_SIZE
@@ -0,0 +1,53 @@
+"""Tests for TimeSeriesAnomalyDetector windowing: strided views vs the original per-window loop"""
+
+import numpy as np
+import pytest
+
+from ml_anomaly_detection import TimeSeriesAnomalyDetector
+
+def loop_sequences(data: np.ndarray, sequence_length: int):
+    """The original prepare_sequences: one copied window per step"""
+    X, y = [], []
+    for i in range(sequence_length, len(data)):
+        X.append(data[i - sequence_length:i])
+        y.append(data[i])
+    return np.array(X), np.array(y)
+
+@pytest.mark.parametrize('n_rows', [0, 10, 11, 12, 257])
+@pytest.mark.parametrize('n_features', [1, 3])
+def test_prepare_sequences_matches_loop(n_rows, n_features):
+    data = np.random.default_rng(n_rows).normal(size=(n_rows, n_features))
+    detector = TimeSeriesAnomalyDetector(sequence_length=10)
+    X, y = detector.prepare_sequences(data)
+    expected_X, expected_y = loop_sequences(data, 10)
+    assert X.shape == (max(n_rows - 10, 0), 10, n_features)
+    if len(expected_X):
+        np.testing.assert_array_equal(X, expected_X)
+        np.testing.assert_array_equal(y, expected_y)
+    else:
+        assert len(y) == 0
+
+def test_sequence_batches_cover_every_window_in_order():
+    data = np.random.default_rng(1).normal(size=(300, 2))
+    detector = TimeSeriesAnomalyDetector(sequence_length=10, batch_size=32)
+    batches = list(detector.iter_sequence_batches(data))
+    assert [len(y) for _X, y in batches] == [32] * 9 + [2]
+    expected_X, expected_y = loop_sequences(data, 10)
+    np.testing.assert_array_equal(np.concatenate([X for X, _y in batches]), expected_X)
+    np.testing.assert_array_equal(np.concatenate([y for _X, y in batches]), expected_y)
+
+@pytest.mark.parametrize('compiled_inference', [False, True])
+def test_reconstruction_errors_match_loop(compiled_inference):
+    """Batched, windowed scoring gives the per-window MSE of the original predict-everything path"""
+    pytest.importorskip('tensorflow')
+    data = np.random.default_rng(2).normal(size=(150, 2)).astype(np.float32)
+    detector = TimeSeriesAnomalyDetector(sequence_length=10, batch_size=16, compiled_inference=compiled_inference)
+    detector.model = detector.build_model(n_features=2)
+
+    X, y = loop_sequences(data, 10)
+    expected = np.mean(np.power(y - detector.model.predict(X, verbose=0), 2), axis=1)
+    np.testing.assert_allclose(detector.reconstruction_errors(data), expected, rtol=1e-4, atol=1e-6)
+
+    windows = np.array([0, 5, 139])
+    np.testing.assert_allclose(detector.reconstruction_errors(data, windows), expected[windows],
+                               rtol=1e-4, atol=1e-6)